@@ -7,37 +7,92 @@ The press cycle generator is silly but I had it lying around from
 a previous project and wanted something more interesting than using
 `np.rand.randint` The generated frames are displayed on the `autovideosink`
 at ~30 fps and are a crude simulation of a running industrial stamping press.
+
+If `numba` is installed the frames are rendered by a jitted kernel into a
+preallocated buffer, otherwise plain numpy is used.
 """
 
 import logging
+import os
 import typing
 
 import numpy as np
 
 from gstreasy import GstPipeline
 
+try:
+    from numba import njit, prange, set_num_threads
+except ImportError:
+    njit = None
+
 # Configure logging
 fmt = "%(levelname)-6.6s | %(name)-20s | %(asctime)s.%(msecs)03d | %(threadName)s | %(message)s"  # noqa: E501
 dmt_fmt = "%d.%m %H:%M:%S"
 log_handler = logging.StreamHandler()
 log_handler.setFormatter(logging.Formatter(fmt=fmt, datefmt=dmt_fmt))
 logging.basicConfig(level=logging.DEBUG, handlers=[log_handler])
+# numba compiles _render at import and would log its internals at DEBUG
+logging.getLogger("numba").setLevel(logging.WARNING)
 log = logging.getLogger(__name__)
 
 
-COLORS = {
-    "red": (255, 0, 0),
-    "yellow": (255, 255, 0),
-    "blue": (0, 0, 255),
-    "green": (0, 128, 0),
-    "white": (255, 255, 255),
-    "aqua": (0, 255, 255),
-    "magenta": (255, 0, 255),
-    "orange": (255, 175, 0),
-    "gray": (188, 188, 188),
+# One RGB row per color, rows are looked up by name with COLOR_INDEX
+COLORS = np.array(
+    [
+        (255, 0, 0),
+        (255, 255, 0),
+        (0, 0, 255),
+        (0, 128, 0),
+        (255, 255, 255),
+        (0, 255, 255),
+        (255, 0, 255),
+        (255, 175, 0),
+        (188, 188, 188),
+    ],
+    dtype=np.uint8,
+)
+COLOR_INDEX = {
+    name: i
+    for i, name in enumerate(
+        ("red", "yellow", "blue", "green", "white", "aqua", "magenta", "orange", "gray")
+    )
 }
 
 
+if njit is None:
+    _render = None
+else:
+
+    # The explicit signature compiles the kernel (or loads it from the cache)
+    # at import, so the first frame doesn't stall on JIT compilation
+    @njit(
+        "boolean(uint8[:, :, ::1], uint8[:, :, ::1], int64, uint8[::1],"
+        " int64, int64, int64, int64, uint8[::1])",
+        cache=True,
+        fastmath=True,
+        parallel=True,
+    )
+    def _render(out, strip, strip_y, strip_color, top_y, bot_y, x, width, color):
+        """Draw the strip and both press dies into `out` in a single pass.
+
+        Rows are independent so they are rendered in parallel.
+        Returns whether the strip is visible between the dies.
+        """
+        rows, length = strip.shape[0], strip.shape[1]
+        strip_visible = top_y + width < strip_y + rows
+        for r in prange(out.shape[0]):
+            out[r] = 0
+            if top_y <= r < top_y + width or bot_y <= r < bot_y + width:
+                for c in range(length):
+                    for n in range(out.shape[2]):
+                        out[r, x + c, n] = color[n]
+            elif strip_visible and strip_y <= r < strip_y + rows:
+                for c in range(length):
+                    for n in range(out.shape[2]):
+                        out[r, x + c, n] = strip[r - strip_y, c, n] * strip_color[n]
+        return strip_visible
+
+
 def press_cycle_gen(
     shape: typing.Tuple[int, int, int],
     fps: int = 30,
@@ -55,41 +110,59 @@ def press_cycle_gen(
             per frame. Defaults to 30.
         crash_cycle (int): Do a simulated die-crash every n cycles.
             Defaults to 1 (every cycle)
-        color (str): String key that maps to a RGB value in `COLORS`.
+        color (str): String key that maps to a RGB row in `COLORS`.
             Sets color of press die. Defaults to 'white'.
+
+    The same ndarray is yielded for every frame, so copy it if you need
+    to keep it around.
     """
     h, w, _ = shape
     cycle_length = 3  # How many secs to complete full 360°
     total_frames = cycle_length * fps
     half = total_frames // 2
-    strip_color = COLORS["gray"]
-
-    def crash_strip(width, length):
-        strip = np.ones((width // 2, length, shape[-1]), dtype=np.uint8)
-        for x in range(0, length, 40):
-            if np.random.randint(0, 2):
-                strip[0 : width // 4, x : x + np.random.randint(20, 40), :] = 0
-        return strip
+    color_rgb = COLORS[COLOR_INDEX[color]]
+    strip_rgb = COLORS[COLOR_INDEX["gray"]]
+
+    # Allocated once and reused for every frame
+    out = np.empty(shape, dtype=np.uint8)
+    length = w - (w // 4)
+    width = length // 4
+    intact_strip = np.ones((width // 4, length, shape[-1]), dtype=np.uint8)
+    die = np.empty((width, length, shape[-1]), dtype=np.uint8)
+    die[:] = color_rgb
+
+    crashed_strip = np.empty((width // 2, length, shape[-1]), dtype=np.uint8)
+    hole_starts = np.arange(0, length, 40)
+    columns = np.arange(length)
+
+    def crash_strip():
+        # Every 40 columns a coin flip decides whether a 20-39 wide hole is
+        # punched in the top half of the strip
+        punched = np.random.randint(0, 2, hole_starts.size).astype(bool)
+        starts = hole_starts[punched, None]
+        stops = starts + np.random.randint(20, 40, (starts.size, 1))
+        holes = ((columns >= starts) & (columns < stops)).any(axis=0)
+        crashed_strip.fill(1)
+        crashed_strip[0 : width // 4, holes] = 0
+        return crashed_strip
+
+    start_top_y = h // 4 - width // 2
+    start_bot_y = (h - h // 4) - width // 2
+    center_x = (w - length) // 2
+    move_dist = start_bot_y - h // 2
+    move_rate = round(move_dist / (half))
+    # Both dies move by the same amount every frame, so if they start out
+    # symmetric they stay symmetric
+    assert h - (start_top_y + width) == (h - (h - start_bot_y))
 
     def press_image(frame: int, crash: bool = False):
-        length = w - (w // 4)
-        width = length // 4
-        press_rect = np.ones((width, length), dtype=np.uint8)
-
         if crash:
-            strip = crash_strip(width, length)
+            strip = crash_strip()
             strip_y = h // 2 - width // 4
         else:
-            strip = np.ones((width // 4, length, shape[-1]), dtype=np.uint8)
+            strip = intact_strip
             strip_y = h // 2 - width // 8
 
-        top_y = h // 4 - width // 2
-        bot_y = (h - h // 4) - width // 2
-        center_x = (w - length) // 2
-
-        move_dist = bot_y - h // 2
-        move_rate = round(move_dist / (half))
-
         if frame < half:
             frame_delta = move_rate * frame
             x = center_x
@@ -103,30 +176,34 @@ def press_cycle_gen(
         elif frame == half:
             frame_delta = move_rate * frame
             x = np.random.randint(center_x - 20, center_x + 21)
-            strip = 1
 
-        top_y, bot_y = top_y + frame_delta, bot_y - frame_delta
+        top_y, bot_y = start_top_y + frame_delta, start_bot_y - frame_delta
 
-        image = np.zeros(shape, dtype=np.uint8)
+        if _render is not None:
+            strip_visible = _render(
+                out, strip, strip_y, strip_rgb, top_y, bot_y, x, width, color_rgb
+            )
+            label = 1 if (crash and strip_visible) else 0
+            return out, label
 
-        assert h - (top_y + width) == (h - (h - bot_y))
+        image = out
+        image.fill(0)
 
         if crash:
             strip_visible = True if ((top_y + width) < strip_y + width // 2) else False
             if strip_visible:
                 image[strip_y : strip_y + width // 2, x : x + length, :] = (
-                    strip * strip_color
+                    strip * strip_rgb
                 )
         else:
             strip_visible = True if ((top_y + width) < strip_y + width // 4) else False
             if strip_visible:
                 image[strip_y : strip_y + width // 4, x : x + length, :] = (
-                    strip * strip_color
+                    strip * strip_rgb
                 )
 
-        for n, c in enumerate(COLORS[color]):
-            for y in [top_y, bot_y]:
-                image[y : y + width, x : x + length, n] = press_rect * c
+        image[top_y : top_y + width, x : x + length] = die
+        image[bot_y : bot_y + width, x : x + length] = die
 
         label = 1 if (crash and strip_visible) else 0
         return image, label
@@ -149,6 +226,9 @@ def press_cycle_gen(
 if __name__ == "__main__":
     width, height, channels = 320, 240, 3
     frame_gen = press_cycle_gen(shape=(height, width, channels), crash_cycle=4)
+    if njit is not None:
+        # Leave a core for the GStreamer streaming threads
+        set_num_threads(max(1, (os.cpu_count() or 1) - 1))
 
     cmd = "appsrc emit-signals=true is-live=true ! videoconvert ! autovideosink"
     with GstPipeline(cmd) as pipeline:
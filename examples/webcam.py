@@ -1,8 +1,22 @@
+"""Pull YUY2 frames from a webcam and convert them to RGB with numba.
+
+Requires `numba` (`pip install gstreasy[numba]`).
+"""
+
 import logging
 import os
 
+import numpy as np
+
 from gstreasy import GstPipeline
 
+try:
+    from numba import njit, prange
+except ImportError as e:
+    raise SystemExit(
+        "This example requires numba, install it with `pip install gstreasy[numba]`"
+    ) from e
+
 # Configure logging
 fmt = "%(levelname)-6.6s | %(name)-20s | %(asctime)s.%(msecs)03d | %(threadName)s | %(message)s"
 dmt_fmt = "%d.%m %H:%M:%S"
@@ -11,18 +25,47 @@ log_handler.setFormatter(logging.Formatter(fmt=fmt, datefmt=dmt_fmt))
 logging.basicConfig(level=logging.DEBUG, handlers=[log_handler])
 log = logging.getLogger(__name__)
 
+
+@njit(cache=True, parallel=True)
+def yuy2_to_rgb(yuy2, out):
+    """Convert a YUY2 frame of shape (height, width, 2) into RGB `out`.
+
+    Each Y0 U Y1 V macropixel gives two RGB pixels, using BT.601 integer math.
+    """
+    for r in prange(out.shape[0]):
+        for c in range(0, out.shape[1] - 1, 2):
+            u = np.int32(yuy2[r, c, 1]) - 128
+            v = np.int32(yuy2[r, c + 1, 1]) - 128
+            dr = (359 * v) >> 8
+            dg = (88 * u + 183 * v) >> 8
+            db = (454 * u) >> 8
+            for k in range(2):
+                y = np.int32(yuy2[r, c + k, 0])
+                out[r, c + k, 0] = min(max(y + dr, 0), 255)
+                out[r, c + k, 1] = min(max(y - dg, 0), 255)
+                out[r, c + k, 2] = min(max(y + db, 0), 255)
+
+
 # Configure pipeline command
-# videoconvert to RGB for numpy compatibility (webcam default usually YUY2)
-caps = "video/x-raw, width=(int)640, height=(int)480, framerate=(fraction)30/1"
+# The webcam's native YUY2 goes straight to the appsink and is converted to
+# RGB by `yuy2_to_rgb`, only for the frames we actually consume
+width, height = 640, 480
+caps = (
+    f"video/x-raw, width=(int){width}, height=(int){height}, "
+    "framerate=(fraction)30/1, format=(string)YUY2"
+)
 device = int(os.getenv("WEBCAM", 0))
 cmd = f"""
     v4l2src device=/dev/video{device}
-      ! {caps} ! videoconvert ! video/x-raw,format=RGB
+      ! {caps}
       ! appsink emit-signals=true
 """
 
+rgb = np.empty((height, width, 3), dtype=np.uint8)
 with GstPipeline(cmd) as pipeline:
     while pipeline:
         buffer = pipeline.pop()
         if buffer:
-            log.info(buffer.data.shape)
+            # 2 bytes (Y and U or V) per pixel, viewed as (height, width, 2)
+            yuy2_to_rgb(buffer.data.reshape(height, width, 2), rgb)
+            log.info(rgb.shape)
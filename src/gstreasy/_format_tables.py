@@ -0,0 +1,70 @@
+"""Per `GstVideo.VideoFormat` lookup tables, built once at import."""
+
+from typing import Dict, Tuple
+
+import gi
+import numpy as np
+
+gi.require_version("GstVideo", "1.0")
+
+from gi.repository import GstVideo  # noqa: E402
+
+DEFAULT_DTYPE = np.dtype(np.uint8)
+_VIDEO_BITS_DTYPES: Dict[int, np.dtype] = {
+    8: np.dtype(np.uint8),
+    16: np.dtype(np.uint16),
+}
+
+# temporal fix
+_CHANNEL_OVERRIDES: Dict[GstVideo.VideoFormat, int] = {GstVideo.VideoFormat.BGRX: 4}
+# Checked in order, the first flag a format has decides its number of channels
+_FLAG_CHANNELS = (
+    (GstVideo.VideoFormatFlags.ALPHA, 4),
+    (GstVideo.VideoFormatFlags.RGB, 3),
+    (GstVideo.VideoFormatFlags.GRAY, 1),
+)
+
+
+def _flag_bit(flag: int) -> int:
+    # in VideoFormatFlags each new value is 1 << 2**{0...8}
+    # (flag - 1).bit_length() is ceil(log2(flag)) without the float math
+    return 1 << max(1, (flag - 1).bit_length())
+
+
+_FLAG_BITS: Dict[int, int] = {
+    int(flag): _flag_bit(int(flag)) for flag, _ in _FLAG_CHANNELS
+}
+
+
+def has_flag(value: GstVideo.VideoFormatFlags, flag: GstVideo.VideoFormatFlags) -> bool:
+    """Return whether the flag is present in."""
+    bit = _FLAG_BITS.get(int(flag)) or _flag_bit(int(flag))
+    return bool(value & bit)
+
+
+def _get_num_channels(
+    fmt: GstVideo.VideoFormat, flags: GstVideo.VideoFormatFlags
+) -> int:
+    if fmt in _CHANNEL_OVERRIDES:
+        return _CHANNEL_OVERRIDES[fmt]
+    for flag, channels in _FLAG_CHANNELS:
+        if has_flag(flags, flag):
+            return channels
+    return -1
+
+
+def _build_tables() -> Tuple[
+    Dict[GstVideo.VideoFormat, int], Dict[GstVideo.VideoFormat, np.dtype]
+]:
+    format_channels = {}
+    format_dtype = {}
+    for f in GstVideo.VIDEO_FORMATS_ALL.strip("{ }").split(","):
+        fmt = GstVideo.VideoFormat.from_string(f.strip())
+        format_info = GstVideo.VideoFormat.get_info(fmt)
+        format_channels[fmt] = _get_num_channels(fmt, format_info.flags)
+        format_dtype[fmt] = _VIDEO_BITS_DTYPES.get(format_info.bits, DEFAULT_DTYPE)
+    return format_channels, format_dtype
+
+
+# One pass over every format known to GstVideo fills both tables
+FORMAT_CHANNELS, FORMAT_DTYPE = _build_tables()
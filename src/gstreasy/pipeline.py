@@ -4,14 +4,22 @@ import logging
 import queue
 import sys
 import threading
-import time
 import typing
 from fractions import Fraction
 
 import gi
 import numpy as np
 
-from .utils import GstBuffer, LeakyQueue, gst_buffer_to_ndarray, make_video_caps
+from .utils import (
+    GstBuffer,
+    GstBufferBatch,
+    LeakyQueue,
+    RingBuffer,
+    gst_buffer_to_ndarray,
+    make_video_caps,
+    ndarray_to_gst_buffer,
+    view_gst_buffer,
+)
 from .wrapped_caps import AudioCaps, VideoCaps, WrappedCaps
 
 gi.require_version("Gst", "1.0")
@@ -30,10 +38,12 @@ class AppSink:
 
     Attributes:
         sink (GstApp.AppSink): the appsink element.
-        queue (queue.Queue, LeakyQueue): The queue buffers are held in.
+        queue (queue.Queue, LeakyQueue, RingBuffer): The queue buffers are held in.
     """
 
-    def __init__(self, sink: GstApp.AppSink, leaky: bool, qsize: int):
+    def __init__(
+        self, sink: GstApp.AppSink, leaky: bool, qsize: int, lock_free: bool = False
+    ):
         """Initialize the AppSink class.
 
         Args:
@@ -42,14 +52,27 @@ class AppSink:
                 leaky Queue (oldest buffers dropped if full) or a
                 normal Queue (block on `Queue.put` if full).
             qsize (int): Max number of buffers to keep in the Queue.
+            lock_free (bool): Hold buffers in a `RingBuffer` instead of a
+                Queue, which avoids taking a lock on every put/get.
         """
         self.sink = sink
         self.sink.connect("new-sample", self._on_buffer, None)
-        self.queue: typing.Union[queue.Queue, LeakyQueue]
-        self.queue = LeakyQueue(qsize) if leaky else queue.Queue(qsize)
+        self.queue: typing.Union[queue.Queue, LeakyQueue, RingBuffer]
+        if lock_free:
+            self.queue = RingBuffer(qsize, leaky)
+        else:
+            self.queue = LeakyQueue(qsize) if leaky else queue.Queue(qsize)
         self._caps: typing.Optional[WrappedCaps] = None
+        self._np_shape: typing.Tuple[int, ...] = ()
+        self._np_dtype: np.dtype = np.dtype(np.uint8)
+        self._np_strides: typing.Tuple[int, ...] = ()
+        self._np_offset: int = 0
+        self._np_size: int = 0
         self._log = logging.getLogger("AppSink")
         self._log.addHandler(logging.NullHandler())
+        # Checked once since the callbacks run for every sample. Logging has
+        # to be configured before the pipeline starts to get their messages.
+        self._debug = self._log.isEnabledFor(logging.DEBUG)
 
     @property
     def caps(self) -> typing.Optional[WrappedCaps]:
@@ -72,7 +95,8 @@ class AppSink:
             self._log.error("Bad sample: type = %s" % type(sample))
             return Gst.FlowReturn.ERROR
 
-        self._log.debug("Got Sample")
+        if self._debug:
+            self._log.debug("Got Sample")
         self.queue.put(self._extract_buffer(sample))
         return Gst.FlowReturn.OK
 
@@ -80,31 +104,53 @@ class AppSink:
         buffer = sample.get_buffer()
 
         # Extract the width and height info from the sample's caps
-        if not self._caps:
-            self._log.debug("Getting caps from first sample")
+        caps = self._caps
+        if not caps:
+            if self._debug:
+                self._log.debug("Getting caps from first sample")
             try:
-                caps = sample.get_caps()
-                caps_name = caps.get_structure(0).get_name()
+                sample_caps = sample.get_caps()
+                caps_name = sample_caps.get_structure(0).get_name()
                 if "audio" in caps_name:
-                    self._caps = AudioCaps.wrap(caps, buffer)
+                    caps = AudioCaps.wrap(sample_caps, buffer)
                 elif "video" in caps_name:
-                    self._caps = VideoCaps.wrap(caps, buffer)
+                    caps = VideoCaps.wrap(sample_caps, buffer)
                 else:
                     raise ValueError("Unsupported Caps!")
             except AttributeError:
                 return None
+            self._caps = caps
+
+        array = gst_buffer_to_ndarray(buffer, caps)
+        # Following samples of the same size have the same layout, so switch
+        # to the fast path which doesn't look at the caps at all
+        self._np_shape, self._np_dtype = array.shape, array.dtype
+        self._np_strides = array.strides
+        # Same offset gst_buffer_to_ndarray viewed this buffer at
+        self._np_offset = caps.view_offset
+        self._np_size = buffer.get_size()
+        self._extract_buffer = self._extract_buffer_fast  # type: ignore
+        return GstBuffer(
+            data=array,
+            pts=buffer.pts,
+            dts=buffer.dts,
+            duration=buffer.duration,
+            offset=buffer.offset,
+        )
 
-        # Use the cached Caps so don't have to re-calc every sample
-        if self._caps:
-            array = gst_buffer_to_ndarray(buffer, self._caps)
-            return GstBuffer(
-                data=array,
-                pts=buffer.pts,
-                dts=buffer.dts,
-                duration=buffer.duration,
-                offset=buffer.offset,
-            )
-        return None
+    def _extract_buffer_fast(self, sample: Gst.Sample) -> typing.Optional[GstBuffer]:
+        buffer = sample.get_buffer()
+        if buffer.get_size() != self._np_size:
+            # Audio buffers vary in size and caps can be renegotiated, so take
+            # the layout from this sample's caps (wrap() results are cached)
+            self._caps = None
+            return AppSink._extract_buffer(self, sample)
+        data = view_gst_buffer(
+            buffer, self._np_shape, self._np_dtype, self._np_strides, self._np_offset
+        )
+        # Positional arguments (data, pts, dts, offset, duration), keywords
+        # take noticeably longer for a NamedTuple and this runs per sample
+        return GstBuffer(data, buffer.pts, buffer.dts, buffer.offset, buffer.duration)
 
     @property
     def queue_size(self) -> int:
@@ -126,34 +172,41 @@ class AppSrc:
             src (GstApp.AppSrc): the appsrc element.
         """
         self.src = src
-        self._caps: typing.Optional[Gst.Caps] = src.get_caps()
 
-        self.pts: typing.Union[int, float] = 0
+        self.pts: int = 0
         self.dts: int = GLib.MAXUINT64
 
         self._log = logging.getLogger("AppSrc")
         self._log.addHandler(logging.NullHandler())
+        self._debug = self._log.isEnabledFor(logging.DEBUG)
 
-        self._duration: typing.Union[int, float] = 0
+        self._duration: int = 0
+        # Framerate as (num, denom), (0, 1) if the caps don't have one
+        self._framerate: typing.Tuple[int, int] = (0, 1)
+        self._frame_index: int = 0
+        self._caps: typing.Optional[Gst.Caps] = None
+        self.caps = src.get_caps()
 
     @property
-    def duration(self) -> typing.Union[int, float]:
-        """This is not well understood."""
-        if not self._duration:
-            self._duration = self._calc_duration()
+    def duration(self) -> int:
+        """Duration of each pushed buffer in nanoseconds, from the caps framerate."""
         return self._duration
 
-    def _calc_duration(self) -> typing.Union[int, float]:
-        """Return duration estimate based on the framerate of the src Caps."""
-        duration: typing.Union[int, float] = 0
+    def _calc_framerate(self) -> typing.Tuple[int, int]:
+        """Return (num, denom) of the framerate of the src Caps."""
         if not self.caps:
-            return duration
-        caps_string = self.caps.to_string()
-        fps = caps_string.split("(fraction)")[1].split(",")[0]
-        if fps:
-            framerate = Fraction(fps)
-            duration = 10**9 / (framerate.numerator / framerate.denominator)
-        return duration
+            return 0, 1
+        has_framerate, num, denom = self.caps.get_structure(0).get_fraction(
+            "framerate"
+        )
+        if has_framerate and num:
+            return num, denom
+        return 0, 1
+
+    def _calc_duration(self) -> int:
+        """Return duration estimate based on the framerate of the src Caps."""
+        num, denom = self._framerate
+        return Gst.SECOND * denom // num if num else 0
 
     @property
     def caps(self) -> typing.Optional[Gst.Caps]:
@@ -163,18 +216,25 @@ class AppSrc:
     @caps.setter
     def caps(self, new_caps: Gst.Caps):
         self._caps = new_caps
+        # Done once here so push() doesn't have to parse the caps
+        self._framerate = self._calc_framerate()
+        self._duration = self._calc_duration()
 
     def push(self, data: np.ndarray):
         """Create a `Gst.Sample` from `np.ndarray` and push it into the pipeline."""
-        self.pts += self.duration
-        offset = self.pts / self.duration
-        gst_buffer = Gst.Buffer.new_wrapped(bytes(data))
+        self._frame_index += 1
+        # Scaled from the exact framerate, multiplying the truncated duration
+        # would accumulate its rounding error with every frame
+        num, denom = self._framerate
+        self.pts = self._frame_index * Gst.SECOND * denom // num if num else 0
+        gst_buffer = ndarray_to_gst_buffer(data)
         gst_buffer.pts = self.pts
         gst_buffer.dts = self.dts
-        gst_buffer.offset = offset
-        gst_buffer.duration = self.duration
-        sample = Gst.Sample.new(buffer=gst_buffer, caps=self.caps)
-        self._log.debug("Push Sample")
+        gst_buffer.offset = self._frame_index
+        gst_buffer.duration = self._duration
+        sample = Gst.Sample.new(buffer=gst_buffer, caps=self._caps)
+        if self._debug:
+            self._log.debug("Push Sample")
         self.src.emit("push-sample", sample)
 
 
@@ -196,6 +256,7 @@ class GstPipeline:
         command: str,
         leaky: bool = False,
         qsize: int = 100,
+        lock_free: bool = False,
     ):
         """Create a `GstPipeline` but don't start it yet.
 
@@ -205,10 +266,14 @@ class GstPipeline:
                 leaky Queue (oldest buffers dropped if full) or a
                 normal Queue (block on `Queue.put` if full).
             qsize (int): Max number of buffers to keep in the Queue.
+            lock_free (bool): Whether the appsink should put buffers in a
+                lock-free `RingBuffer` instead of a Queue. Only safe when a
+                single thread calls `pop`.
         """
         self.command = command
         self.leaky = leaky
         self.qsize = qsize
+        self.lock_free = lock_free
 
         self.pipeline: typing.Optional[Gst.Pipeline] = None
         """The actual Pipeline created by calling
@@ -221,14 +286,19 @@ class GstPipeline:
         self.elements: typing.List[Gst.Element] = []
         """A list of all `Gst.Element`'s in the `pipeline`."""
 
+        self._elements_by_cls: typing.Dict[type, typing.List[Gst.Element]] = {}
+
         self._main_loop = GLib.MainLoop.new(None, is_running=False)
         self._main_loop_thread = threading.Thread(
             target=self._main_loop_run, name="MainLoop"
         )
         self._end_stream_event = threading.Event()
+        self._eos_received = threading.Event()
 
         self._appsink: typing.Optional[AppSink] = None
         self._appsrc: typing.Optional[AppSrc] = None
+        # Buffers pop_n took from the queue but left for its next call
+        self._pop_n_pending: typing.List[GstBuffer] = []
 
         self._log = logging.getLogger("GstPipeline")
         self._log.addHandler(logging.NullHandler())
@@ -236,7 +306,8 @@ class GstPipeline:
     def __bool__(self) -> bool:
         """Return whether or not pipeline is active or there are buffers to process."""
         if self.appsink:
-            return not self.is_done or self.appsink.queue_size > 0
+            buffered = self.appsink.queue_size > 0 or bool(self._pop_n_pending)
+            return not self.is_done or buffered
         return not self.is_done
 
     def __str__(self) -> str:
@@ -263,17 +334,19 @@ class GstPipeline:
             self._log.warning("%s" % ex)
             pass
 
-    def _init_elements(self):
+    def _init_elements(self) -> typing.List[Gst.Element]:
+        """Return all pipeline elements and index them by class for `get_by_cls`."""
+        out: typing.List[Gst.Element] = []
+        self._elements_by_cls = {}
         if self.pipeline:
             elements = self.pipeline.iterate_elements()
-            out = []
             while True:
                 ret, elem = elements.next()
-                if ret == Gst.IteratorResult.DONE:
-                    break
                 if ret != Gst.IteratorResult.OK:
                     break
                 out.append(elem)
+                for cls in type(elem).__mro__:
+                    self._elements_by_cls.setdefault(cls, []).append(elem)
         return out
 
     def get_by_cls(self, cls: GObject.GType) -> typing.List[Gst.Element]:
@@ -282,10 +355,7 @@ class GstPipeline:
         Args:
             cls (GObject.GType): The Element class to match against.
         """
-        if not self.elements:
-            # FIXME
-            return []
-        return [e for e in self.elements if isinstance(e, cls)]
+        return list(self._elements_by_cls.get(cls, ()))
 
     def get_by_name(self, name: str) -> typing.Optional[Gst.Element]:
         """Return Gst.Element from pipeline by name lookup.
@@ -319,8 +389,9 @@ class GstPipeline:
             )
             thread.start()
             thread.join(timeout=timeout)
-
-        time.sleep(timeout)
+            # Return as soon as the EOS has reached the sinks instead of
+            # always sleeping for the whole timeout
+            self._eos_received.wait(timeout)
 
         try:
             self.pipeline.set_state(Gst.State.NULL)
@@ -376,6 +447,7 @@ class GstPipeline:
         self.pipeline.set_state(Gst.State.READY)
         self._log.debug("Set pipeline to READY")
         self._end_stream_event.clear()
+        self._eos_received.clear()
 
         # Allow pipeline to PREROLL by setting in PAUSED state so caps
         # negotiation happens before configuring appsink/appsrc
@@ -428,10 +500,24 @@ class GstPipeline:
         except IndexError:
             self._log.debug("No AppSink element detected")
             return None
-        return AppSink(appsink_element, self.leaky, self.qsize)
+        return AppSink(appsink_element, self.leaky, self.qsize, self.lock_free)
+
+    def pop(
+        self,
+        timeout: float = 0.1,
+        transform: typing.Optional[typing.Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> typing.Optional[GstBuffer]:
+        """Return a `GstBuffer` from the `appsink` queue.
+
+        The buffer's data views the memory of the upstream `Gst.Buffer`, which
+        stays mapped until the array (and every view of it) is gone. Copy the
+        data of frames you keep, see `GstBuffer`.
 
-    def pop(self, timeout: float = 0.1) -> typing.Optional[GstBuffer]:
-        """Return a `GstBuffer` from the `appsink` queue."""
+        Args:
+            timeout (float): Seconds to wait for each attempt to get a buffer.
+            transform (Callable, optional): Applied to the buffer's data before
+                it's returned, e.g. a `gstreasy.transforms.Transform`.
+        """
         if not self.appsink:
             self._log.critical("No AppSink to pop buffer from")
             self.shutdown()
@@ -447,8 +533,63 @@ class GstPipeline:
             except KeyboardInterrupt:
                 self._log.critical("I'm interrupted!")
                 self.shutdown()
+        if buf and transform is not None:
+            buf = buf._replace(data=transform(buf.data))
         return buf
 
+    def pop_batch(self, n: int, timeout: float = 0.1) -> typing.List[GstBuffer]:
+        """Return a list of up to `n` `GstBuffer`'s from the `appsink` queue.
+
+        Waits like `pop` for the first buffer, then only takes buffers that
+        are already queued. The list is empty if no buffer arrived in time.
+        As with `pop`, copy the data of buffers you keep.
+        """
+        buf = self.pop(timeout)
+        if not buf or not self.appsink:
+            return []
+        batch = [buf]
+        get_nowait = self.appsink.queue.get_nowait
+        while len(batch) < n:
+            try:
+                buf = get_nowait()
+            except queue.Empty:
+                break
+            if buf:
+                batch.append(buf)
+        return batch
+
+    def pop_n(self, n: int, timeout: float = 0.1) -> typing.Optional[GstBufferBatch]:
+        """Return up to `n` buffers from the `appsink` queue as a `GstBufferBatch`.
+
+        The buffers are taken like in `pop_batch`. Their data is copied into a
+        single array of shape (len(batch), *data.shape) and their timestamps
+        into uint64 arrays. `None` if no buffer arrived in time.
+
+        Only buffers with the same data shape and dtype can be stacked. The
+        batch ends before the first buffer that differs (e.g. a short audio
+        buffer or after caps renegotiation) and the remaining buffers are
+        returned by the next call. Don't mix `pop_n` with `pop`/`pop_batch`
+        on the same pipeline, those don't see the held back buffers.
+        """
+        if self._pop_n_pending:
+            batch, self._pop_n_pending = self._pop_n_pending, []
+        else:
+            batch = self.pop_batch(n, timeout)
+        if not batch:
+            return None
+        shape, dtype = batch[0].data.shape, batch[0].data.dtype
+        for i, buf in enumerate(batch):
+            if buf.data.shape != shape or buf.data.dtype != dtype:
+                batch, self._pop_n_pending = batch[:i], batch[i:]
+                break
+        return GstBufferBatch(
+            data=np.stack([buf.data for buf in batch]),
+            pts=np.array([buf.pts for buf in batch], dtype=np.uint64),
+            dts=np.array([buf.dts for buf in batch], dtype=np.uint64),
+            offset=np.array([buf.offset for buf in batch], dtype=np.uint64),
+            duration=np.array([buf.duration for buf in batch], dtype=np.uint64),
+        )
+
     def set_appsrc_video_caps(
         self,
         *,
@@ -521,6 +662,7 @@ class GstPipeline:
     def on_eos(self, bus: Gst.Bus, msg: Gst.Message):
         """Log `EOS` messages and shutdown pipeline."""
         self._log.debug("Received EOS message")
+        self._eos_received.set()
         self._shutdown_pipeline(eos=True)
 
     def on_warning(self, bus: Gst.Bus, msg: Gst.Message):
@@ -0,0 +1,93 @@
+"""Jitted per-pixel conversions for the ndarrays pulled from an `appsink`.
+
+Requires `numba` (`pip install gstreasy[numba]`).
+
+Example:
+    ```python
+    from gstreasy.transforms import Transform, bgrx_to_rgb
+
+    to_rgb = Transform(bgrx_to_rgb, channels=3)
+    buffer = pipeline.pop(transform=to_rgb)
+    ```
+"""
+
+import typing
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError as e:
+    raise ImportError(
+        "gstreasy.transforms requires numba, install it with "
+        "`pip install gstreasy[numba]`"
+    ) from e
+
+Kernel = typing.Callable[[np.ndarray, np.ndarray], None]
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def bgrx_to_rgb(src, dst):
+    """Write the RGB channels of a BGRx/BGRA (or BGR) frame `src` into `dst`."""
+    for i in prange(src.shape[0]):
+        for j in range(src.shape[1]):
+            dst[i, j, 0] = src[i, j, 2]
+            dst[i, j, 1] = src[i, j, 1]
+            dst[i, j, 2] = src[i, j, 0]
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def normalize(src, dst):
+    """Write the uint8 frame `src` scaled to [0.0, 1.0] into `dst`."""
+    for i in prange(src.shape[0]):
+        for j in range(src.shape[1]):
+            for c in range(src.shape[2]):
+                dst[i, j, c] = src[i, j, c] * np.float32(1 / 255)
+
+
+class Transform:
+    """Run a jitted `kernel(src, dst)` into an output array that is allocated once.
+
+    The output array is reused, so every call overwrites the result of the
+    previous one. Copy it if you need to keep it around.
+
+    Attributes:
+        kernel (Callable): Writes the converted `src` into `dst`.
+        channels (int): Channels of the output, `None` to keep the input's.
+        dtype (np.dtype): dtype of the output, `None` to keep the input's.
+    """
+
+    def __init__(
+        self,
+        kernel: Kernel,
+        channels: typing.Optional[int] = None,
+        dtype: typing.Optional[np.dtype] = None,
+    ):
+        """Initialize the Transform class.
+
+        Args:
+            kernel (Callable): Writes the converted `src` into `dst`, both are
+                3 dimensional (height, width, channels).
+            channels (int, optional): Channels of the output.
+                Defaults to the channels of the input.
+            dtype (np.dtype, optional): dtype of the output.
+                Defaults to the dtype of the input.
+        """
+        self.kernel = kernel
+        self.channels = channels
+        self.dtype = None if dtype is None else np.dtype(dtype)
+        self._dst: typing.Optional[np.ndarray] = None
+
+    def __call__(self, src: np.ndarray) -> np.ndarray:
+        """Return `src` converted by the kernel."""
+        squeezed = src.ndim == 2
+        if squeezed:
+            # Single channel frames are squeezed to (height, width)
+            src = src[..., np.newaxis]
+        shape = src.shape[:2] + (self.channels or src.shape[2],)
+        dtype = self.dtype or src.dtype
+        dst = self._dst
+        if dst is None or dst.shape != shape or dst.dtype != dtype:
+            dst = self._dst = np.empty(shape, dtype=dtype)
+        self.kernel(src, dst)
+        return dst[..., 0] if squeezed and shape[2] == 1 else dst
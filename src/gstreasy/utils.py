@@ -1,10 +1,11 @@
 """Utility Classes and functions."""
 import queue
+import threading
 import typing
-from contextlib import contextmanager
+from collections import deque
 from fractions import Fraction
+from functools import lru_cache
 
-import attrs
 import gi
 import numpy as np
 
@@ -18,9 +19,15 @@ from gi.repository import GLib, Gst, GstVideo, GstAudio  # noqa: E402
 Framerate = typing.Union[int, Fraction, str]
 
 
-@attrs.define(slots=True, frozen=True)
-class GstBuffer:
-    """Use np.ndarray as backing for buffer."""
+class GstBuffer(typing.NamedTuple):
+    """Use np.ndarray as backing for buffer.
+
+    When popped from an `appsink`, `data` is a read-only view of the mapped
+    `Gst.Buffer` (no copy is made). The upstream buffer stays mapped and
+    referenced until every view of it is garbage collected, which can stall
+    elements with a fixed buffer pool (v4l2src, hardware decoders). Call
+    `data.copy()` on frames you keep around.
+    """
 
     data: np.ndarray
     pts: int = GLib.MAXUINT64
@@ -29,6 +36,16 @@ class GstBuffer:
     duration: int = GLib.MAXUINT64
 
 
+class GstBufferBatch(typing.NamedTuple):
+    """Buffers stacked into one np.ndarray with per buffer metadata arrays."""
+
+    data: np.ndarray
+    pts: np.ndarray
+    dts: np.ndarray
+    offset: np.ndarray
+    duration: np.ndarray
+
+
 class LeakyQueue(queue.Queue):
     """Mimics behavior of gstreamer `queue leaky=2`.
 
@@ -46,24 +63,147 @@ class LeakyQueue(queue.Queue):
         maxsize: int = 100,
     ):
         """Initialize the Queue."""
+        self._maxlen = maxsize or None
+        self.dropped: int = 0
         super().__init__(maxsize=maxsize)
+
+    def _init(self, maxsize):
+        # The deque drops the oldest buffer itself once it's at maxsize
+        self.queue = deque(maxlen=self._maxlen)
+
+    def full(self) -> bool:
+        """Return True if the next put will drop the oldest buffer."""
+        with self.mutex:
+            return len(self.queue) == self._maxlen
+
+    def put(self, item, block=True, timeout=None):
+        """Insert new item into queue. Drop oldest item if full.
+
+        Never blocks, `block` and `timeout` are only accepted for
+        compatibility with `queue.Queue`.
+        """
+        with self.not_full:
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _put(self, item):
+        if len(self.queue) == self._maxlen:
+            self.dropped += 1
+        self.queue.append(item)
+
+
+class RingBuffer:
+    """Lock-free alternative to `queue.Queue` for a single producer and consumer.
+
+    Meant for the `AppSink` where exactly one thread puts buffers (the
+    GStreamer streaming thread) and one thread gets them (`GstPipeline.pop`).
+    Items live in a bounded `collections.deque` whose `append` and `popleft`
+    are atomic, so no lock is taken on the put/get fast path. Events are only
+    used to wake up a side that has to wait.
+
+    Args:
+        maxsize (int): Maximum number of buffers to hold.
+        leaky (bool): Drop the oldest buffer when full instead of blocking
+            `put` (like gstreamer `queue leaky=2`).
+
+    Attributes:
+        dropped (int): Total number of dropped buffers.
+    """
+
+    def __init__(self, maxsize: int = 100, leaky: bool = False):
+        """Initialize the RingBuffer."""
+        self.maxsize = maxsize
+        self.leaky = leaky
         self.dropped: int = 0
+        self._items: typing.Deque[typing.Any] = deque(maxlen=maxsize or None)
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+
+    def qsize(self) -> int:
+        """Return number of items in the buffer."""
+        return len(self._items)
+
+    def empty(self) -> bool:
+        """Return whether the buffer is empty."""
+        return not self._items
+
+    def full(self) -> bool:
+        """Return whether the buffer is full."""
+        return 0 < self.maxsize <= len(self._items)
 
     def put(self, item, block=True, timeout=None):
-        """Insert new item into queue. Drop oldest item if full."""
+        """Insert new item. If full drop the oldest item or wait if not leaky."""
         if self.full():
-            self.get_nowait()
-            self.dropped += 1
-        super().put(item, block, timeout)
+            if self.leaky:
+                # The deque discards the oldest item on append
+                self.dropped += 1
+            else:
+                self._wait(self._not_full, self.full, block, timeout, queue.Full)
+        self._items.append(item)
+        if not self._not_empty.is_set():
+            self._not_empty.set()
+
+    def get(self, block=True, timeout=None):
+        """Remove and return the oldest item. Raise `queue.Empty` on timeout."""
+        try:
+            item = self._items.popleft()
+        except IndexError:
+            self._wait(self._not_empty, self.empty, block, timeout, queue.Empty)
+            item = self._items.popleft()
+        if not self._not_full.is_set():
+            self._not_full.set()
+        return item
+
+    def put_nowait(self, item):
+        """Insert new item without blocking."""
+        self.put(item, block=False)
+
+    def get_nowait(self):
+        """Remove and return the oldest item without blocking."""
+        return self.get(block=False)
+
+    @staticmethod
+    def _wait(
+        event: threading.Event,
+        blocked: typing.Callable[[], bool],
+        block: bool,
+        timeout: typing.Optional[float],
+        exc: typing.Type[Exception],
+    ):
+        """Wait for `event` until `blocked()` is false or raise `exc`."""
+        while blocked():
+            if not block:
+                raise exc
+            # Re-check after clearing so a wake-up in between isn't lost
+            event.clear()
+            if not blocked():
+                break
+            if not event.wait(timeout):
+                raise exc
 
 
 def make_video_caps(
     width: int, height: int, framerate: Framerate, format: str
 ) -> Gst.Caps:
-    """Return Gst.Caps built from arguments."""
-    framerate = str(Fraction(framerate))
-    if "/" not in framerate:
-        framerate = framerate + "/1"
+    """Return Gst.Caps built from arguments.
+
+    Results are cached, so the returned caps may be shared and must not be
+    modified.
+    """
+    # Skip parsing a Fraction for the common int and "num/denom" cases
+    if isinstance(framerate, int):
+        framerate = f"{framerate}/1"
+    elif not (isinstance(framerate, str) and "/" in framerate):
+        framerate = str(Fraction(framerate))
+        if "/" not in framerate:
+            framerate = framerate + "/1"
+    return _make_video_caps(width, height, framerate, format)
+
+
+@lru_cache(maxsize=64)
+def _make_video_caps(width: int, height: int, framerate: str, format: str) -> Gst.Caps:
+    # Keyed by the normalized framerate so 30, "30/1" and Fraction(30) share caps
     video_format = GstVideo.VideoFormat.from_string(format)
     if not video_format:
         raise ValueError("caps format %s" % format)
@@ -77,16 +217,62 @@ def make_video_caps(
     return caps
 
 
-@contextmanager
-def map_gst_buffer(buf: Gst.Buffer, flags: Gst.MapFlags):
-    """Map Gst.Buffer with READ or WRITE flags."""
-    try:
-        mapped, map_info = buf.map(flags)
-        # FIXME figure out what should happen if !mapped
-        if mapped:
-            yield map_info
-    finally:
-        buf.unmap(map_info)
+class _MapGstBuffer:
+    """Map Gst.Buffer with READ or WRITE flags.
+
+    Used as a context manager, the `Gst.MapInfo` is returned on enter and the
+    buffer is unmapped on exit.
+
+    Raises:
+        RuntimeError: on enter if the buffer can't be mapped with `flags`.
+    """
+
+    __slots__ = ("buf", "flags", "map_info")
+
+    def __init__(self, buf: Gst.Buffer, flags: Gst.MapFlags):
+        self.buf = buf
+        self.flags = flags
+        self.map_info: typing.Any = None
+
+    def __enter__(self):
+        mapped, map_info = self.buf.map(self.flags)
+        if not mapped:
+            raise RuntimeError("Could not map Gst.Buffer")
+        self.map_info = map_info
+        return map_info
+
+    def __exit__(self, *exc_info):
+        self.buf.unmap(self.map_info)
+        self.map_info = None
+
+
+map_gst_buffer = _MapGstBuffer
+
+
+# Whether mapped Gst.Buffer memory can be written through from python,
+# None until the first ndarray_to_gst_buffer call finds out
+_mapped_memory_writable: typing.Optional[bool] = None
+
+
+def ndarray_to_gst_buffer(data: np.ndarray) -> Gst.Buffer:
+    """Return a new Gst.Buffer holding the contents of the ndarray.
+
+    The array is copied straight into the buffer's memory, so no intermediate
+    `bytes` object is created (non-contiguous arrays are handled too).
+    """
+    global _mapped_memory_writable
+    if _mapped_memory_writable is not False:
+        buf = Gst.Buffer.new_allocate(None, data.nbytes, None)
+        with map_gst_buffer(buf, Gst.MapFlags.WRITE) as mapped:
+            dst = np.ndarray(data.shape, buffer=mapped.data, dtype=data.dtype)
+            _mapped_memory_writable = dst.flags.writeable
+            if _mapped_memory_writable:
+                np.copyto(dst, data)
+                return buf
+    # Without the gst-python overrides mapped memory is exposed as read-only
+    # bytes. tobytes() is a plain memcpy for contiguous arrays and copies
+    # non-contiguous ones in C order.
+    return Gst.Buffer.new_wrapped(data.tobytes())
 
 
 def caps_from_string(string: str) -> Gst.Caps:
@@ -94,13 +280,89 @@ def caps_from_string(string: str) -> Gst.Caps:
     return Gst.Caps.from_string(string)
 
 
+class _MappedBuffer:
+    """Keeps a `Gst.Buffer` mapped for as long as an ndarray views its memory.
+
+    Arrays created with `as_array` use this object as their `base`, so the
+    buffer is unmapped (and its reference dropped) once the last array
+    referencing it is garbage collected.
+    """
+
+    __slots__ = ("buf", "map_info", "data", "__array_interface__")
+
+    def __init__(self, buf: Gst.Buffer, flags: Gst.MapFlags):
+        self.buf = buf
+        self.map_info: typing.Any = None
+        mapped, map_info = buf.map(flags)
+        if not mapped:
+            raise RuntimeError("Could not map Gst.Buffer")
+        self.map_info = map_info
+        # Hold on to the exported memory so ndarray views of it stay valid
+        self.data = map_info.data
+
+    def as_array(
+        self,
+        shape: typing.Tuple[int, ...],
+        dtype: np.dtype,
+        strides: typing.Optional[typing.Tuple[int, ...]] = None,
+        offset: int = 0,
+    ) -> np.ndarray:
+        """Return ndarray of `shape` viewing the mapped memory (no copy is made).
+
+        Raises:
+            ValueError: if the view doesn't fit in the mapped memory.
+        """
+        exported = np.frombuffer(self.data, dtype=np.uint8)
+        # numpy can't check the bounds of a raw pointer, so do it here
+        if 0 in shape:
+            extent = offset
+        elif strides is None:
+            extent = offset + int(np.prod(shape)) * dtype.itemsize
+        else:
+            last = sum((n - 1) * step for n, step in zip(shape, strides))
+            extent = offset + last + dtype.itemsize
+        if offset < 0 or extent > exported.size:
+            raise ValueError(
+                f"buffer of {exported.size} bytes is too small for an array of "
+                f"shape {tuple(shape)} ({extent} bytes)"
+            )
+        pointer, readonly = exported.__array_interface__["data"]
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": tuple(shape),
+            "typestr": dtype.str,
+            "data": (pointer + offset, readonly),
+            "strides": strides,
+        }
+        return np.asarray(self)
+
+    def __del__(self):
+        if self.map_info is not None:
+            self.buf.unmap(self.map_info)
+
+
 def gst_buffer_to_ndarray(buf: Gst.Buffer, caps: WrappedCaps) -> np.ndarray:
-    """Return ndarray extracted from Gst.Buffer."""
-    arr: np.ndarray
-    with map_gst_buffer(buf, Gst.MapFlags.READ) as mapped:
-        arr = np.ndarray(
-            mapped.size // caps.dtype.itemsize, buffer=mapped.data, dtype=caps.dtype
+    """Return ndarray viewing the memory of Gst.Buffer (no copy is made)."""
+    mapping = _MappedBuffer(buf, Gst.MapFlags.READ)
+    if caps.view_shape is not None:
+        # The strides of packed video skip the padding at the end of rows
+        return mapping.as_array(
+            caps.view_shape, caps.dtype, caps.view_strides, caps.view_offset
         )
-        arr = arr.reshape(caps.shape)
+    n_elements = caps.n_elements or mapping.map_info.size // caps.dtype.itemsize
+    arr = mapping.as_array((n_elements,), caps.dtype)
+    return arr.reshape(caps.shape).squeeze()
+
 
-    return arr.squeeze()
+def view_gst_buffer(
+    buf: Gst.Buffer,
+    shape: typing.Tuple[int, ...],
+    dtype: np.dtype,
+    strides: typing.Optional[typing.Tuple[int, ...]] = None,
+    offset: int = 0,
+) -> np.ndarray:
+    """Return ndarray of `shape` viewing the memory of Gst.Buffer (no copy is made).
+
+    Faster than `gst_buffer_to_ndarray` when the shape is already known.
+    """
+    return _MappedBuffer(buf, Gst.MapFlags.READ).as_array(shape, dtype, strides, offset)
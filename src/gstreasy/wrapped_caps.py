@@ -1,6 +1,5 @@
 import attrs
-import math
-from typing import Union, List, Dict
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from abc import (
     ABC,
     abstractmethod,
@@ -16,16 +15,59 @@ gi.require_version("GstAudio", "1.0")
 
 from gi.repository import GLib, Gst, GstVideo, GstAudio  # noqa: E402
 
+from ._format_tables import (  # noqa: E402, F401
+    DEFAULT_DTYPE,
+    FORMAT_CHANNELS,
+    FORMAT_DTYPE,
+    has_flag,
+)
+
 
 @attrs.define(slots=True, frozen=True)
 class WrappedCaps(ABC):
     channels: int
     format: Union[GstVideo.VideoFormat, GstAudio.AudioFormat]
     dtype: np.dtype
+    # Size in bytes of the buffers these caps were created for
+    total_bytes: int = attrs.field(default=0, kw_only=True)
+    n_elements: int = attrs.field(init=False, repr=False, eq=False)
+    # Shape and strides of the ndarray viewing a buffer, with the dimensions
+    # of size 1 already dropped. Computed once, `None` if not known up front.
+    view_shape: Optional[Tuple[int, ...]] = attrs.field(
+        init=False, repr=False, eq=False
+    )
+    view_strides: Optional[Tuple[int, ...]] = attrs.field(
+        init=False, repr=False, eq=False
+    )
+    # Byte offset of the view's first element, 0 unless `view_shape` is known
+    view_offset: int = attrs.field(init=False, repr=False, eq=False)
+
+    def __attrs_post_init__(self):
+        """Compute the view layout and element count from the other fields."""
+        shape, strides = self.shape, self.strides
+        if min(shape) < 1:
+            view_shape, view_strides = None, None
+        else:
+            keep = [i for i, n in enumerate(shape) if n != 1]
+            view_shape = tuple(shape[i] for i in keep)
+            view_strides = None if strides is None else tuple(strides[i] for i in keep)
+        object.__setattr__(self, "n_elements", self.total_bytes // self.dtype.itemsize)
+        object.__setattr__(self, "view_shape", view_shape)
+        object.__setattr__(self, "view_strides", view_strides)
+        object.__setattr__(self, "view_offset", 0)
 
     @classmethod
-    @abstractmethod
     def wrap(cls, caps: Gst.Caps, buf: Gst.Buffer):
+        """Transform `Gst.Caps` into `WrappedCaps`.
+
+        Results are cached by caps string (and buffer size), so caps that were
+        seen before are not parsed again.
+        """
+        return _wrap_cached(cls, caps.to_string(), buf.get_size())
+
+    @classmethod
+    @abstractmethod
+    def _from_caps(cls, caps: Gst.Caps, buf_size: int):
         pass
 
     @property
@@ -33,6 +75,11 @@ class WrappedCaps(ABC):
     def shape(self) -> List[int]:
         pass
 
+    @property
+    def strides(self) -> Optional[Tuple[int, ...]]:
+        """Return byte steps of the ndarray, `None` if it is C-contiguous."""
+        return None
+
 
 @attrs.define(slots=True, frozen=True)
 class AudioCaps(WrappedCaps):
@@ -42,20 +89,20 @@ class AudioCaps(WrappedCaps):
     samples_per_channel: int
 
     @classmethod
-    def wrap(cls, caps: Gst.Caps, buf: Gst.Buffer):
-        """Transform `Gst.Caps` into `WrappedCaps`."""
+    def _from_caps(cls, caps: Gst.Caps, buf_size: int):
         structure = caps.get_structure(0)
-        sampling_frequency = structure.get_value("rate")
-        format = GstAudio.AudioFormat.from_string(structure.get_value("format"))
-        channels = structure.get_value("channels")
+        _, sampling_frequency = structure.get_int("rate")
+        format = GstAudio.AudioFormat.from_string(structure.get_string("format"))
+        _, channels = structure.get_int("channels")
         dtype = _get_audio_np_dtype(format)
-        samples_per_channel = buf.get_size() // dtype.itemsize // channels
+        samples_per_channel = buf_size // dtype.itemsize // channels
         return cls(
             format=format,
             channels=channels,
             dtype=dtype,
             sampling_frequency=sampling_frequency,
             samples_per_channel=samples_per_channel,
+            total_bytes=buf_size,
         )
 
     @property
@@ -70,17 +117,45 @@ class VideoCaps(WrappedCaps):
 
     width: int
     height: int
+    stride: int = 0
+    offset: int = 0
+    # Whether pixels are packed into one plane with one element per channel
+    packed: bool = False
+
+    def __attrs_post_init__(self):
+        """Leave the view layout unknown for formats that aren't packed."""
+        super().__attrs_post_init__()
+        if self.strides is None:
+            object.__setattr__(self, "view_shape", None)
+            object.__setattr__(self, "view_strides", None)
+        elif self.view_shape is not None:
+            object.__setattr__(self, "view_offset", self.offset)
 
     @classmethod
-    def wrap(cls, caps: Gst.Caps, buf: Gst.Buffer):
-        """Transform `Gst.Caps` into `WrappedCaps`."""
+    def _from_caps(cls, caps: Gst.Caps, buf_size: int):
         structure = caps.get_structure(0)
-        width, height = structure.get_value("width"), structure.get_value("height")
-        format = GstVideo.VideoFormat.from_string(structure.get_value("format"))
+        _, width = structure.get_int("width")
+        _, height = structure.get_int("height")
+        format = GstVideo.VideoFormat.from_string(structure.get_string("format"))
         channels = get_num_channels(format)
         dtype = _get_video_np_dtype(format)
+        # Rows may be padded for alignment, so take the actual layout of the
+        # first plane from the VideoInfo instead of assuming width * channels
+        info = GstVideo.VideoInfo.new()
+        info.from_caps(caps)
+        # e.g. RGB16 has 3 channels in 2 byte pixels and RGBx 3 in 4 bytes
+        pixel_size = channels * dtype.itemsize
+        packed = info.finfo.n_planes == 1 and info.finfo.pixel_stride[0] == pixel_size
         return cls(
-            width=width, height=height, channels=channels, format=format, dtype=dtype
+            width=width,
+            height=height,
+            channels=channels,
+            format=format,
+            dtype=dtype,
+            stride=info.stride[0],
+            offset=info.offset[0],
+            packed=packed,
+            total_bytes=buf_size,
         )
 
     @property
@@ -88,59 +163,40 @@ class VideoCaps(WrappedCaps):
         """Return shape of np.ndarray required to hold buffer with these Caps."""
         return [self.height, self.width, self.channels]
 
+    @property
+    def strides(self) -> Optional[Tuple[int, int, int]]:
+        """Return byte steps of the ndarray viewing a buffer with these Caps.
+
+        `None` for formats that aren't packed into a single plane with one
+        element per channel.
+        """
+        if not self.packed or not self.stride:
+            return None
+        return (
+            self.stride,
+            self.channels * self.dtype.itemsize,
+            self.dtype.itemsize,
+        )
+
+
+@lru_cache(maxsize=32)
+def _wrap_cached(cls, caps_string: str, buf_size: int) -> WrappedCaps:
+    return cls._from_caps(Gst.Caps.from_string(caps_string), buf_size)
 
+
+_AUDIO_DEPTH_DTYPES: Dict[int, np.dtype] = {
+    8: np.dtype(np.int8),
+    16: np.dtype(np.int16),
+}
+
+
+@lru_cache(maxsize=None)
 def _get_audio_np_dtype(fmt: GstAudio.AudioFormat) -> np.dtype:
-    dtypes = {
-        8: np.dtype(np.int8),
-        16: np.dtype(np.int16),
-    }
     format_info = GstAudio.AudioFormat.get_info(fmt)
-    return dtypes.get(format_info.depth, np.dtype(np.uint8))
-
-
-def _get_video_np_dtype(fmt: GstVideo.VideoFormat) -> np.dtype:
-    dtypes = {
-        8: np.dtype(np.uint8),
-        16: np.dtype(np.uint16),
-    }
-    format_info = GstVideo.VideoFormat.get_info(fmt)
-    return dtypes.get(format_info.bits, np.dtype(np.uint8))
-
-
-@lru_cache(1024)
-def _format_channels() -> Dict[GstVideo.VideoFormat, int]:
-    all_formats = [
-        GstVideo.VideoFormat.from_string(f.strip())
-        for f in GstVideo.VIDEO_FORMATS_ALL.strip("{ }").split(",")
-    ]
-    format_channels = {}
-    for fmt in all_formats:
-        channels = _get_num_channels(fmt)
-        format_channels[fmt] = channels
-    return format_channels
-
-
-def get_num_channels(fmt: GstVideo.VideoFormat) -> int:
-    """Raise KeyError if not present."""
-    return _format_channels()[fmt]
-
-
-def _get_num_channels(fmt: GstVideo.VideoFormat) -> int:
-    frmt_info = GstVideo.VideoFormat.get_info(fmt)
-
-    # temporal fix
-    if fmt == GstVideo.VideoFormat.BGRX:
-        return 4
-    if has_flag(frmt_info.flags, GstVideo.VideoFormatFlags.ALPHA):
-        return 4
-    if has_flag(frmt_info.flags, GstVideo.VideoFormatFlags.RGB):
-        return 3
-    if has_flag(frmt_info.flags, GstVideo.VideoFormatFlags.GRAY):
-        return 1
-    return -1
-
-
-def has_flag(value: GstVideo.VideoFormatFlags, flag: GstVideo.VideoFormatFlags) -> bool:
-    """Return whether the flag is present in."""
-    # in VideoFormatFlags each new value is 1 << 2**{0...8}
-    return bool(value & (1 << max(1, math.ceil(math.log2(int(flag))))))
+    return _AUDIO_DEPTH_DTYPES.get(format_info.depth, DEFAULT_DTYPE)
+
+
+# Both raise KeyError for formats unknown to GstVideo
+get_num_channels: Callable[[GstVideo.VideoFormat], int] = FORMAT_CHANNELS.__getitem__
+"""Return number of channels of a video format. Raise KeyError if not present."""
+_get_video_np_dtype = FORMAT_DTYPE.__getitem__
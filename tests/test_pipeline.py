@@ -5,8 +5,11 @@ import numpy as np
 from gstreasy import GstPipeline
 
 
+rng = np.random.default_rng()
+
+
 def rand_array(channels: int = 3):
-    return np.random.randint(low=0, high=255, size=(240, 320, channels), dtype=np.uint8)
+    return rng.integers(0, 256, size=(240, 320, channels), dtype=np.uint8)
 
 
 def test_simple():
@@ -65,9 +68,11 @@ def test_appsrc_with_video_caps():
     num_buffers = 10
     caps = "video/x-raw,width=320,height=240,framerate=60/1,format=RGB"
     cmd = f"appsrc caps={caps} emit-signals=true num-buffers={num_buffers} ! fakesink"
+    # push() copies the array into a new Gst.Buffer, so one array can be reused
+    frame = rand_array()
     with GstPipeline(cmd) as pipeline:
         while pipeline:
-            pipeline.push(rand_array())
+            pipeline.push(frame)
 
 
 def test_video_appsrc_no_caps():
@@ -78,12 +83,13 @@ def test_video_appsrc_no_caps():
         "videoconvert ! fakesink"
     )
 
+    frame = rand_array(channels=1)
     with GstPipeline(cmd) as pipeline:
         pipeline.set_appsrc_video_caps(
             width=320, height=240, framerate=10, format="GRAY8"
         )
         while pipeline:
-            pipeline.push(rand_array(channels=1))
+            pipeline.push(frame)
 
 
 def test_video_appsrc_and_sink():
@@ -93,14 +99,107 @@ def test_video_appsrc_and_sink():
         f"appsrc emit-signals=true num-buffers={num_buffers} ! "
         "appsink emit-signals=true"
     )
+    frame = rand_array(channels=1)
     with GstPipeline(cmd) as pipeline:
         pipeline.set_appsrc_video_caps(
             width=320, height=240, framerate=10, format="GRAY8"
         )
         while pipeline:
-            pipeline.push(rand_array(channels=1))
+            pipeline.push(frame)
             buffer = pipeline.pop()
             if buffer:
                 assert buffer.data.shape == (240, 320)
                 count += 1
         assert count == num_buffers
+
+
+def test_appsink_buffers_outlive_pipeline():
+    num_buffers = 10
+    cmd = (
+        f"videotestsrc num-buffers={num_buffers} ! "
+        "video/x-raw,format=RGB,width=320,height=240 ! appsink emit-signals=true"
+    )
+    buffers = []
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            buffer = pipeline.pop()
+            if buffer:
+                buffers.append(buffer)
+    assert len(buffers) == num_buffers
+    for buffer in buffers:
+        assert buffer.data.shape == (240, 320, 3)
+        assert int(buffer.data.sum()) > 0
+
+
+def test_appsink_padded_rows():
+    # RGB rows of width 33 are padded from 99 to 100 bytes
+    cmd = (
+        "videotestsrc num-buffers=1 pattern=white ! "
+        "video/x-raw,format=RGB,width=33,height=24 ! appsink emit-signals=true"
+    )
+    buffers = []
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            buffer = pipeline.pop()
+            if buffer:
+                buffers.append(buffer)
+    assert len(buffers) == 1
+    assert buffers[0].data.shape == (24, 33, 3)
+    assert (buffers[0].data == 255).all()
+
+
+def test_lock_free_appsink_buffers():
+    num_buffers, count = 10, 0
+    cmd = f"videotestsrc num-buffers={num_buffers} ! appsink emit-signals=true"
+    with GstPipeline(cmd, lock_free=True) as pipeline:
+        while pipeline:
+            buffer = pipeline.pop()
+            if buffer:
+                count += 1
+    assert count == num_buffers
+
+
+def test_appsink_pop_batch():
+    num_buffers, count = 10, 0
+    cmd = f"videotestsrc num-buffers={num_buffers} ! appsink emit-signals=true"
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            batch = pipeline.pop_batch(4)
+            assert len(batch) <= 4
+            count += len(batch)
+    assert count == num_buffers
+
+
+def test_appsink_pop_n():
+    num_buffers, count = 10, 0
+    cmd = (
+        f"videotestsrc num-buffers={num_buffers} ! "
+        "video/x-raw,format=RGB,width=320,height=240 ! appsink emit-signals=true"
+    )
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            batch = pipeline.pop_n(4)
+            if batch:
+                assert batch.data.shape[0] <= 4
+                assert batch.data.shape[1:] == (240, 320, 3)
+                assert batch.pts.shape == (batch.data.shape[0],)
+                count += batch.data.shape[0]
+    assert count == num_buffers
+
+
+def test_appsink_pop_n_varying_sizes():
+    # Resampling 44.1 kHz to 48 kHz gives buffers of 1088 or 1089 samples
+    num_buffers, count = 10, 0
+    cmd = (
+        f"audiotestsrc num-buffers={num_buffers} samplesperbuffer=1000 ! "
+        "audio/x-raw,rate=44100,channels=1 ! audioresample ! "
+        "audio/x-raw,rate=48000 ! appsink emit-signals=true"
+    )
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            batch = pipeline.pop_n(4)
+            if batch:
+                assert batch.data.ndim == 2
+                assert batch.pts.shape == (batch.data.shape[0],)
+                count += batch.data.shape[0]
+    assert count >= num_buffers
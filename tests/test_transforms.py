@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from gstreasy import GstPipeline  # noqa: E402
+from gstreasy.transforms import Transform, bgrx_to_rgb, normalize  # noqa: E402
+
+
+def test_bgrx_to_rgb():
+    src = np.random.default_rng().integers(0, 256, size=(240, 320, 4), dtype=np.uint8)
+    to_rgb = Transform(bgrx_to_rgb, channels=3)
+    dst = to_rgb(src)
+    assert dst.shape == (240, 320, 3)
+    assert (dst == src[..., 2::-1]).all()
+    # The output array is reused
+    assert to_rgb(src) is dst
+
+
+def test_normalize():
+    src = np.random.default_rng().integers(0, 256, size=(240, 320), dtype=np.uint8)
+    dst = Transform(normalize, dtype=np.float32)(src)
+    assert dst.shape == src.shape
+    assert dst.dtype == np.float32
+    assert np.allclose(dst, src / 255)
+
+
+def test_pop_with_transform():
+    num_buffers, count = 10, 0
+    cmd = (
+        f"videotestsrc num-buffers={num_buffers} ! "
+        "video/x-raw,format=BGRx,width=320,height=240 ! appsink emit-signals=true"
+    )
+    to_rgb = Transform(bgrx_to_rgb, channels=3)
+    with GstPipeline(cmd) as pipeline:
+        while pipeline:
+            buffer = pipeline.pop(transform=to_rgb)
+            if buffer:
+                count += 1
+                assert buffer.data.shape == (240, 320, 3)
+    assert count == num_buffers
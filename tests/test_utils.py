@@ -0,0 +1,72 @@
+import queue
+import threading
+
+import pytest
+
+from gstreasy.utils import LeakyQueue, RingBuffer, map_gst_buffer
+
+
+class UnmappableBuffer:
+    unmapped = False
+
+    def map(self, flags):
+        return False, None
+
+    def unmap(self, map_info):
+        self.unmapped = True
+
+
+def test_map_gst_buffer_raises_if_not_mapped():
+    buf = UnmappableBuffer()
+    with pytest.raises(RuntimeError):
+        with map_gst_buffer(buf, None):
+            pass
+    assert not buf.unmapped
+
+
+def test_leaky_queue_drops_oldest():
+    q = LeakyQueue(maxsize=2)
+    for i in range(5):
+        q.put(i)
+    assert q.maxsize == 2
+    assert q.full()
+    assert q.dropped == 3
+    assert q.qsize() == 2
+    assert [q.get_nowait(), q.get_nowait()] == [3, 4]
+    assert q.empty()
+
+
+def test_ring_buffer_fifo():
+    rb = RingBuffer(maxsize=3)
+    for i in range(3):
+        rb.put(i)
+    assert rb.full()
+    assert [rb.get() for _ in range(3)] == [0, 1, 2]
+    assert rb.empty()
+    with pytest.raises(queue.Empty):
+        rb.get(timeout=0.01)
+
+
+def test_ring_buffer_blocks_when_full():
+    rb = RingBuffer(maxsize=1)
+    rb.put(0)
+    with pytest.raises(queue.Full):
+        rb.put(1, timeout=0.01)
+
+
+def test_ring_buffer_leaky_drops_oldest():
+    rb = RingBuffer(maxsize=2, leaky=True)
+    for i in range(5):
+        rb.put(i)
+    assert rb.dropped == 3
+    assert [rb.get_nowait(), rb.get_nowait()] == [3, 4]
+
+
+def test_ring_buffer_threaded():
+    num_items = 1000
+    rb = RingBuffer(maxsize=10)
+    producer = threading.Thread(target=lambda: [rb.put(i) for i in range(num_items)])
+    producer.start()
+    items = [rb.get(timeout=1) for _ in range(num_items)]
+    producer.join()
+    assert items == list(range(num_items))